@@ -1,12 +1,25 @@
 import os
-import json
-import base64
+import io
+import time
+import queue
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal
+from cachetools import LRUCache
 from dotenv import load_dotenv
+import orjson
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+from PIL import Image, ImageOps, UnidentifiedImageError
+from pydantic import BaseModel
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1._helpers import encode_dict
+from google.rpc import code_pb2
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 
 # Load environment variables from .env file
 load_dotenv()
@@ -21,28 +34,356 @@ gemini_api_key = os.environ.get("GOOGLE_API_KEY")
 
 # --- Firebase Admin SDK Initialization ---
 # The Admin SDK allows the backend to securely access Firestore.
-try:
-    if not firebase_admin._apps:
-        # Use Application Default Credentials (ADC) to authenticate.
-        # This will automatically use the service account assigned to the GCE instance.
-        # No key file is needed on the VM. This is a secure, production-ready method.
-        cred = credentials.ApplicationDefault()
-        firebase_admin.initialize_app(cred)
-    
-    # Get a reference to the Firestore database client.
-    db = firestore.client()
-    print("Firebase Admin SDK initialized successfully using keyless authentication.")
-except Exception as e:
-    print(f"Error initializing Firebase Admin SDK: {e}")
-    db = None
+# Set by `init_clients()`; None until then, or if initialization failed.
+db = None
+
+# Items are saved with a Firestore BulkWriter, which batches, parallelizes and
+# retries the writes itself. A failed write is retried up to this many times,
+# but only for status codes that can succeed on a later attempt. Anything else
+# (e.g. INVALID_ARGUMENT for an oversized document) fails straight away, so it
+# doesn't hold up the shared committer.
+FIRESTORE_MAX_WRITE_ATTEMPTS = 5
+FIRESTORE_RETRYABLE_CODES = {
+    code_pb2.ABORTED,
+    code_pb2.UNAVAILABLE,
+    code_pb2.DEADLINE_EXCEEDED,
+    code_pb2.RESOURCE_EXHAUSTED,
+}
+
+# --- Shared Write Buffer ---
+# Instead of each /save-items request committing its own writes, requests put
+# their items on this queue and a single committer thread drains it. Items from
+# many users that arrive close together then share the same Firestore batches.
+# Each drained group is committed by its own BulkWriter on a small pool, so the
+# committer keeps draining while earlier groups are still in flight.
+#
+# The trade-off is that saves are no longer read-your-writes: /save-items
+# answers 202 before the items are committed, so they show up in Firestore a
+# moment later (the front-end's onSnapshot listener picks them up). When a
+# Gunicorn worker exits cleanly, `stop_write_committer` commits everything that
+# is queued or in flight first. Items not yet committed are only lost if the
+# process dies without that happening (a crash, SIGKILL, or a graceful
+# shutdown that outlasts Gunicorn's timeout).
+#
+# The buffer is bounded so that a slow or unreachable Firestore pushes back on
+# clients: when it is full, /save-items waits briefly for room and then answers
+# 503 instead of acknowledging items it may never be able to save.
+WRITE_BUFFER_MAX_ITEMS = 500
+WRITE_BUFFER_WAIT_SECONDS = 0.05
+WRITE_BUFFER_MAX_REQUESTS = 1000
+WRITE_BUFFER_PUT_TIMEOUT_SECONDS = 2.0
+# Each entry is one request's list of (user_id, document_ref, item) tuples, so
+# a request is either queued in full or refused in full.
+write_queue = queue.Queue(maxsize=WRITE_BUFFER_MAX_REQUESTS)
+# How many drained groups may be committing at once. When all slots are busy
+# the committer waits, and the queue fills up into larger groups meanwhile.
+WRITE_COMMITS_IN_FLIGHT = 4
+commit_executor = ThreadPoolExecutor(max_workers=WRITE_COMMITS_IN_FLIGHT)
+commit_slots = threading.BoundedSemaphore(WRITE_COMMITS_IN_FLIGHT)
+# How often an idle committer checks whether it has been asked to stop.
+WRITE_COMMITTER_POLL_SECONDS = 1.0
+committer_stopping = threading.Event()
+# Set by `init_clients()` once the committer thread is started.
+committer_thread = None
+
+def drain_write_queue(max_items, timeout):
+    """
+    Waits up to WRITE_COMMITTER_POLL_SECONDS for a first request's writes, then
+    keeps collecting queued requests until at least `max_items` writes are
+    gathered or `timeout` seconds have passed. Returns an empty list if nothing
+    was queued.
+    """
+    try:
+        writes = list(write_queue.get(timeout=WRITE_COMMITTER_POLL_SECONDS))
+    except queue.Empty:
+        return []
+    deadline = time.monotonic() + timeout
+    while len(writes) < max_items:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            writes.extend(write_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return writes
+
+def commit_writes(writes):
+    """
+    Saves a list of queued writes with one BulkWriter and logs, per user, how
+    many were saved and the document IDs of any that didn't. Returns the IDs
+    of the documents that were saved.
+    """
+    # A write only counts as saved once Firestore reports a result for it.
+    # If a whole batch RPC fails (e.g. the network drops), BulkWriter swallows
+    # the exception without calling either callback, so anything not seen
+    # here is treated as failed.
+    saved_ids = set()
+
+    def record_success(doc_ref, write_result, bulk_writer):
+        saved_ids.add(doc_ref.id)
+
+    def retry_or_record(error, bulk_writer):
+        if error.code in FIRESTORE_RETRYABLE_CODES and error.attempts < FIRESTORE_MAX_WRITE_ATTEMPTS:
+            return True
+        print(f"Failed to save {error.operation.reference.path}: {error.message}")
+        return False
+
+    bulk_writer = db.bulk_writer()
+    bulk_writer.on_write_result(record_success)
+    bulk_writer.on_write_error(retry_or_record)
+    try:
+        # Items are only encoded when BulkWriter fills a batch, so an item that
+        # can't be encoded would fail every write in its batch. `save_items`
+        # checks that each item encodes before queuing it.
+        for user_id, doc_ref, item in writes:
+            bulk_writer.create(doc_ref, item)
+        # Wait for every write, including retries, to finish. `close()` would
+        # refuse the retried writes, so use `flush()` instead.
+        bulk_writer.flush()
+    except Exception:
+        # `flush()` shuts down BulkWriter's send pool when it completes; if it
+        # raised part-way, nothing public does, so stop the pool here.
+        bulk_writer._executor.shutdown(wait=False)
+        raise
+    finally:
+        # Log the per-user results even if sending the writes raised.
+        log_write_results(writes, saved_ids)
+    return saved_ids
+
+def log_write_results(writes, saved_ids):
+    """Logs, per user, how many writes were saved and the IDs of any that weren't."""
+    if len(saved_ids) < len(writes):
+        print(f"Error: only {len(saved_ids)} of {len(writes)} buffered writes were saved to Firestore.")
+
+    saved_counts = {}
+    failed_by_user = {}
+    for user_id, doc_ref, item in writes:
+        if doc_ref.id in saved_ids:
+            saved_counts[user_id] = saved_counts.get(user_id, 0) + 1
+        else:
+            failed_by_user.setdefault(user_id, []).append(doc_ref.id)
+    for user_id, count in saved_counts.items():
+        print(f"Saved {count} items for user {user_id}.")
+    for user_id, doc_ids in failed_by_user.items():
+        print(f"Failed to save {len(doc_ids)} items for user {user_id}: {doc_ids}")
+
+def submit_writes(writes):
+    """Hands a group of writes to the commit pool, waiting for a free slot first."""
+    commit_slots.acquire()
+
+    def finish(future):
+        commit_slots.release()
+        if future.exception() is not None:
+            print(f"Error committing {len(writes)} buffered writes to Firestore: {future.exception()}")
+
+    commit_executor.submit(commit_writes, writes).add_done_callback(finish)
+
+def run_write_committer():
+    """Drains queued writes into shared batches until `stop_write_committer` is called."""
+    while not committer_stopping.is_set():
+        writes = drain_write_queue(WRITE_BUFFER_MAX_ITEMS, WRITE_BUFFER_WAIT_SECONDS)
+        if writes:
+            submit_writes(writes)
+
+def stop_write_committer():
+    """
+    Stops the committer thread, commits whatever is still queued, and waits
+    for every in-flight commit to finish. Called when a worker shuts down.
+    """
+    committer_stopping.set()
+    if committer_thread is not None:
+        # Returns once the committer has handed its current group to the pool.
+        committer_thread.join()
+    while True:
+        writes = []
+        while len(writes) < WRITE_BUFFER_MAX_ITEMS:
+            try:
+                writes.extend(write_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not writes:
+            break
+        submit_writes(writes)
+    commit_executor.shutdown(wait=True)
 
 # --- Gemini API Configuration ---
-# Use the Gemini API client. The API key is loaded from the environment.
 GEMINI_MODEL="gemini-2.0-flash"
-client = genai.Client(api_key=gemini_api_key)
+# Uploads larger than this are rejected before they are fully read into memory.
+MAX_IMAGE_BYTES = 8 * 1024 * 1024
+# Set by `init_clients()`.
+client = None
+# Caps how many Gemini calls one worker process has in flight at once. Under
+# gevent the worker can accept hundreds of connections, and this keeps a
+# burst of uploads from turning into a burst of rate-limit errors.
+GEMINI_MAX_CONCURRENCY = 40
+gemini_semaphore = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+
+# Gemini HTTP status codes that usually clear up on their own: rate limiting
+# (429), overload (503) and timeouts (504). Other errors fail straight away.
+GEMINI_RETRYABLE_CODES = {429, 503, 504}
+GEMINI_MAX_RETRY_WAIT_SECONDS = 30
+gemini_backoff = wait_random_exponential(multiplier=1, max=GEMINI_MAX_RETRY_WAIT_SECONDS)
+
+def is_retryable_gemini_error(e):
+    """Returns True if a Gemini API error is worth retrying."""
+    return isinstance(e, errors.APIError) and e.code in GEMINI_RETRYABLE_CODES
+
+def wait_for_gemini_retry(retry_state):
+    """
+    Waits as long as the server's Retry-After header asks for, if it sent one.
+    Otherwise falls back to exponential backoff with jitter.
+    """
+    e = retry_state.outcome.exception()
+    headers = getattr(getattr(e, 'response', None), 'headers', None) or {}
+    try:
+        return min(float(headers.get('Retry-After')), GEMINI_MAX_RETRY_WAIT_SECONDS)
+    except (TypeError, ValueError):
+        return gemini_backoff(retry_state)
+
+@retry(
+    retry=retry_if_exception(is_retryable_gemini_error),
+    wait=wait_for_gemini_retry,
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+def call_gemini(parts, config):
+    """Sends a generate_content request to Gemini, retrying transient errors."""
+    # The semaphore is only held while a call is in flight, not between retries.
+    with gemini_semaphore:
+        return client.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=parts,
+            config=config
+        )
+
+# Gemini reads receipt text just as well at 2048 px on the longest side, so
+# larger photos are shrunk and recompressed before they are uploaded.
+MAX_IMAGE_DIMENSION = 2048
+JPEG_QUALITY = 80
+# Refuse to decode images with more pixels than this to guard against
+# decompression bombs. It comfortably covers current phone cameras.
+# Pillow on its own only warns between this limit and twice it, so
+# `downscale_image` checks the size itself.
+Image.MAX_IMAGE_PIXELS = 64_000_000
+
+# Leading bytes of the formats accepted by /parse-receipt (JPEG and PNG).
+IMAGE_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG')
+
+def downscale_image(image_bytes):
+    """
+    Resizes an image so its longest side is at most MAX_IMAGE_DIMENSION and
+    re-encodes it as JPEG. Returns the new JPEG bytes.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    # `open` only reads the header, so this runs before any pixels are decoded.
+    if img.width * img.height > Image.MAX_IMAGE_PIXELS:
+        raise Image.DecompressionBombError(
+            f"Image size ({img.width * img.height} pixels) exceeds the limit of {Image.MAX_IMAGE_PIXELS} pixels."
+        )
+    # Apply the EXIF orientation first, since re-encoding drops the EXIF data.
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.LANCZOS)
+    buf = io.BytesIO()
+    img.convert('RGB').save(buf, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return buf.getvalue()
+
+# --- Receipt Parser Prompt ---
+# The instructions are the same for every receipt, so they are sent to Gemini
+# as a system instruction and only the image changes between requests.
+RECEIPT_PROMPT = (
+    "You are a highly accurate receipt item parser. "
+    "Take the provided image of a grocery receipt and extract a JSON array "
+    "of objects. Each object in the array should have the following keys: "
+    "'receiptName' (the raw item name from the receipt), "
+    "'humanName' (a human-readable, common name for the item), "
+    "'quantity' (the number of units), "
+    "'cost' (the total cost for that item, as a float), "
+    "'useByDate' (a reasonable estimated use by date in YYYY-MM-DD format), and "
+    "'storage' (the most likely storage location: 'Fridge', 'Freezer', 'Cupboard', or 'Countertop')."
+)
+
+# Passed to Gemini as the response schema, so the model returns JSON in exactly
+# this shape. The SDK sends the docstring to the model as the schema
+# description, so it is written for the model rather than for developers.
+class GroceryItem(BaseModel):
+    """A single line item from a grocery receipt."""
+    receiptName: str
+    humanName: str
+    # A float so that items sold by weight (e.g. 0.5 kg) can be represented.
+    quantity: float
+    cost: float
+    useByDate: str
+    storage: Literal['Fridge', 'Freezer', 'Cupboard', 'Countertop']
+
+# --- Client Initialization ---
+def init_clients():
+    """
+    Creates the Firestore and Gemini clients and starts the write committer.
+
+    gRPC channels don't survive a fork, so under Gunicorn this runs in each
+    worker after it starts (see gunicorn.conf.py) rather than at import time.
+    """
+    global db, client, committer_thread
+    try:
+        if not firebase_admin._apps:
+            # Use Application Default Credentials (ADC) to authenticate.
+            # This will automatically use the service account assigned to the GCE instance.
+            # No key file is needed on the VM. This is a secure, production-ready method.
+            cred = credentials.ApplicationDefault()
+            firebase_admin.initialize_app(cred)
+
+        # Get a reference to the Firestore database client.
+        db = firestore.client()
+        print("Firebase Admin SDK initialized successfully using keyless authentication.")
+        committer_thread = threading.Thread(target=run_write_committer, daemon=True)
+        committer_thread.start()
+    except Exception as e:
+        print(f"Error initializing Firebase Admin SDK: {e}")
+        db = None
+
+    # Use the Gemini API client. The API key is loaded from the environment.
+    client = genai.Client(api_key=gemini_api_key)
+
+# --- Parsed Receipt Cache ---
+# Users often submit the same photo again (a retry or a second review), so
+# results are cached by a hash of the uploaded bytes. Only exact duplicates
+# hit the cache; two photos of the same receipt are parsed separately.
+RECEIPT_CACHE_SIZE = 1024
+receipt_cache = LRUCache(maxsize=RECEIPT_CACHE_SIZE)
+# LRUCache is not thread-safe, and lookups reorder its entries.
+receipt_cache_lock = threading.Lock()
+
+def receipt_cache_key(image_bytes):
+    """Returns the cache key for an uploaded image."""
+    return hashlib.blake2b(image_bytes, digest_size=16).digest()
 
 # --- Flask Server Setup ---
+class OrjsonProvider(JSONProvider):
+    """Serializes `jsonify` responses with orjson, which is much faster than the stdlib json module."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+# Let Werkzeug refuse oversized request bodies before parsing the form.
+# The extra megabyte leaves room for the multipart headers around the image.
+app.config['MAX_CONTENT_LENGTH'] = MAX_IMAGE_BYTES + 1024 * 1024
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """Returns JSON instead of Werkzeug's HTML page when a body exceeds MAX_CONTENT_LENGTH."""
+    return jsonify({"error": "Request body is too large."}), 413
+
+@app.before_request
+def reject_non_multipart_uploads():
+    """Rejects receipt uploads that aren't multipart/form-data before the body is parsed."""
+    if request.endpoint == 'parse_receipt' and request.mimetype != 'multipart/form-data':
+        return jsonify({"error": "Expected a multipart/form-data request with an image file."}), 400
 
 # The Flask application's main route
 @app.route('/', methods=['GET'])
@@ -57,71 +398,100 @@ def parse_receipt():
     Handles a POST request with a receipt image and sends it to the Gemini API
     for parsing.
     """
+    if client is None:
+        return jsonify({"error": "Gemini client not initialized. Cannot parse receipts."}), 500
+
     # Check if a file was included in the request
     if 'image' not in request.files:
         return jsonify({"error": "No image file provided"}), 400
 
     image_file = request.files['image']
 
-    # Read the image data and encode it in base64
+    # Read the raw image bytes from the upload stream. The SDK takes raw bytes,
+    # so there is no need to base64-encode the image ourselves. Reading one byte
+    # past the limit tells us whether the upload is too large.
     try:
-        image_bytes = image_file.read()
-        base64_image = base64.b64encode(image_bytes).decode('utf-8')
+        image_bytes = image_file.stream.read(MAX_IMAGE_BYTES + 1)
     except Exception as e:
         return jsonify({"error": f"Failed to read image file: {str(e)}"}), 500
 
-    # --- Construct the prompt for Gemini ---
-    prompt_text = (
-        "You are a highly accurate receipt item parser. "
-        "Take the provided image of a grocery receipt and extract a JSON array "
-        "of objects. Each object in the array should have the following keys: "
-        "'receiptName' (the raw item name from the receipt), "
-        "'humanName' (a human-readable, common name for the item), "
-        "'quantity' (the number of units), "
-        "'cost' (the total cost for that item, as a float), "
-        "'useByDate' (a reasonable estimated use by date in YYYY-MM-DD format), and "
-        "'storage' (the most likely storage location: 'Fridge', 'Freezer', 'Cupboard', or 'Countertop')."
-        "\n\nOnly return the JSON array. Do not include any other text."
-    )
+    if len(image_bytes) > MAX_IMAGE_BYTES:
+        return jsonify({"error": f"Image file is too large. The maximum size is {MAX_IMAGE_BYTES // (1024 * 1024)} MB."}), 413
+
+    # Cheap checks that catch empty files and non-images before any decoding
+    # or Gemini call is attempted.
+    if not image_bytes:
+        return jsonify({"error": "Image file is empty."}), 400
+    if not image_bytes.startswith(IMAGE_SIGNATURES):
+        return jsonify({"error": "Unsupported image format. Please upload a JPEG or PNG."}), 400
 
-    # Combine the text prompt with the image data for a multimodal request.
-    prompt_parts = [{
-        "text": prompt_text,
-        "inline_data": {'mime_type': 'image/jpeg', 'data': base64_image}
-    }]
+    # Return the earlier result if this exact image has been parsed before.
+    cache_key = receipt_cache_key(image_bytes)
+    with receipt_cache_lock:
+        cached_data = receipt_cache.get(cache_key)
+    if cached_data is not None:
+        return jsonify(cached_data), 200
+
+    # Shrink the image to cut upload time and image tokens on the Gemini side.
+    try:
+        image_bytes = downscale_image(image_bytes)
+    except UnidentifiedImageError:
+        return jsonify({"error": "Image file could not be decoded."}), 400
+    except Image.DecompressionBombError as e:
+        return jsonify({"error": f"Invalid image file: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"Failed to process image file: {str(e)}"}), 500
+
+    # The prompt is sent as the system instruction, so only the image needs
+    # to go in the request contents.
+    prompt_parts = [types.Part.from_bytes(data=image_bytes, mime_type='image/jpeg')]
+
+    config = types.GenerateContentConfig(
+        system_instruction=RECEIPT_PROMPT,
+        temperature=0.2,  # Adjust the creativity level
+        response_mime_type="application/json",
+        response_schema=list[GroceryItem]
+    )
 
     # --- Call the Gemini API ---
     try:
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            parts=prompt_parts,
-            generation_config=types.GenerationConfig(
-                temperature=0.2  # Adjust the creativity level
-            )
-        )
-    
-        parsed_data = json.loads(response.text)
-        return jsonify(parsed_data), 200
-    except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {e}")
-        print(f"Received text: {response.text}")
-        return jsonify({"error": "Failed to parse data from Gemini. Invalid JSON response."}), 500
+        response = call_gemini(prompt_parts, config)
     except Exception as e:
         print(f"Error with Gemini API call: {e}")
         return jsonify({"error": "An unexpected error occurred with the Gemini API."}), 500
 
+    # The SDK validates the response against the schema and sets `parsed`
+    # to a list of GroceryItem, or to None if the response didn't match.
+    if response.parsed is None:
+        print(f"Received text: {response.text}")
+        return jsonify({"error": "Failed to parse data from Gemini. Invalid JSON response."}), 500
+
+    parsed_data = [item.model_dump() for item in response.parsed]
+    with receipt_cache_lock:
+        receipt_cache[cache_key] = parsed_data
+    return jsonify(parsed_data), 200
+
 # The new API endpoint to save data to Firestore
 @app.route('/save-items', methods=['POST'])
 def save_items():
     """
-    Receives an array of grocery items and saves them to the Firestore database.
+    Receives an array of grocery items and queues them to be saved to the
+    Firestore database. Responds with 202 before the items are committed; see
+    the Shared Write Buffer section above.
     """
     if db is None:
         return jsonify({"error": "Database not initialized. Cannot save data."}), 500
 
+    # Read the body outside the try below, so that an oversized body reaches
+    # the 413 handler instead of being reported as a database error.
+    body = request.get_data()
+
     try:
         # Get the JSON data sent from the front-end.
-        items_data = request.get_json()
+        try:
+            items_data = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return jsonify({"error": "Invalid data format. Request body is not valid JSON."}), 400
 
         if not isinstance(items_data, list):
             return jsonify({"error": "Invalid data format. Expected a JSON array."}), 400
@@ -138,12 +508,32 @@ def save_items():
         # `artifacts/{appId}/users/{userId}/groceries`
         groceries_collection_ref = db.collection(f"artifacts/default-app-id/users/{user_id}/groceries")
 
-        # Iterate through the items and save each one as a new document.
+        if not all(isinstance(item, dict) for item in items_data):
+            return jsonify({"error": "Invalid data format. Each item must be a JSON object."}), 400
+
+        # Reject items Firestore can't encode (e.g. integers outside int64) now,
+        # since they are written in batches shared with other users' items.
+        for item in items_data:
+            try:
+                encode_dict(item)
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": f"Invalid item: {str(e)}"}), 400
+
+        # Queue the items for the shared committer thread. Document IDs are
+        # generated here so they can be returned to the caller straight away.
+        # Each reference is created exactly once: a retried write reuses the
+        # same ID, and because it is a `create`, it can never save a duplicate.
+        writes = []
         for item in items_data:
-            # We don't specify a document ID, so Firestore will generate one for us.
-            groceries_collection_ref.add(item)
-        
-        return jsonify({"message": f"Successfully saved {len(items_data)} items to Firestore."}), 200
+            # `document()` with no arguments generates a new auto-ID on the client side.
+            writes.append((user_id, groceries_collection_ref.document(), item))
+        try:
+            write_queue.put(writes, timeout=WRITE_BUFFER_PUT_TIMEOUT_SECONDS)
+        except queue.Full:
+            return jsonify({"error": "The server is busy saving other items. Please try again shortly."}), 503
+        doc_ids = [doc_ref.id for user_id, doc_ref, item in writes]
+
+        return jsonify({"message": f"Queued {len(items_data)} items to be saved to Firestore.", "ids": doc_ids}), 202
 
     except Exception as e:
         print(f"Error saving to Firestore: {e}")
@@ -151,6 +541,7 @@ def save_items():
 
 if __name__ == '__main__':
     # When you run this script, it will start a local development server.
-    # In production on a GCE instance, you would use a production-ready
-    # server like Gunicorn or uWSGI.
+    # In production on a GCE instance, run the app under Gunicorn instead
+    # (see wsgi.py for the command).
+    init_clients()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,30 @@
+# Gunicorn settings for the backend. Gunicorn picks this file up automatically
+# when started from this directory:
+#
+#   gunicorn wsgi:app
+
+import multiprocessing
+
+bind = "0.0.0.0:5000"
+workers = multiprocessing.cpu_count()
+# gevent workers let one process wait on many Gemini/Firestore calls at once.
+worker_class = "gevent"
+worker_connections = 200
+
+
+def post_worker_init(worker):
+    """
+    Creates the Gemini and Firestore clients inside each worker.
+
+    gRPC channels opened before a fork are not safe to use in the child, so
+    every worker builds its own long-lived clients once the app is loaded.
+    This runs after gevent has patched the worker, unlike `post_fork`.
+    """
+    import backend
+    backend.init_clients()
+
+
+def worker_exit(server, worker):
+    """Commits every queued or in-flight item in the write buffer before the worker exits."""
+    import backend
+    backend.stop_write_committer()
@@ -0,0 +1,22 @@
+# WSGI entry point for running the backend under Gunicorn with gevent workers.
+#
+# The Gemini and Firestore calls spend most of their time waiting on the
+# network, so gevent workers let each process serve many requests at once
+# instead of blocking on one call at a time. Start the server with:
+#
+#   gunicorn wsgi:app
+#
+# The worker settings and per-worker client setup live in gunicorn.conf.py.
+
+# Patch the standard library before anything else is imported, so that
+# sockets, threads and sleeps used by `requests`/`httpx` yield to gevent.
+from gevent import monkey
+monkey.patch_all()
+
+# gRPC (used by Firestore) has its own I/O loop and needs to be told about gevent.
+import grpc.experimental.gevent as grpc_gevent
+grpc_gevent.init_gevent()
+
+from backend import app
+
+__all__ = ["app"]